@@ -1,75 +1,380 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
+from flask.json.provider import JSONProvider
+import orjson
 import os
-import json
 import logging
-from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+import queue
+import atexit
+import time
+import hashlib
+import inspect
+import threading
 from werkzeug.utils import secure_filename
 import tempfile
 import shutil
-import uuid
-import fitz  # PyMuPDF
-from pdf_extractor import PDFHeadingExtractor
+import multiprocessing
+import functools
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from streaming_form_data import StreamingFormDataParser
+from streaming_form_data.parser import ParseFailedException
+from streaming_form_data.targets import BaseTarget, ValueTarget
+from pdf_extractor import (PDFHeadingExtractor, PDFValidationError, PDFExtractionError,
+                           process_pdf_for_analysis, process_pdf_for_outline,
+                           process_pdf_bytes_for_outline)
+
+class OrjsonProvider(JSONProvider):
+    """JSON provider that serializes responses with orjson"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS), mimetype='application/json')
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 CORS(app)
 
 # Configuration
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max file size
+MAX_PDF_PAGES = 50
+MAX_BATCH_FILES = 10
 UPLOAD_FOLDER = 'app/input'
 OUTPUT_FOLDER = 'app/output'
-ALLOWED_EXTENSIONS = {'pdf'}
+ALLOWED_SUFFIX = '.pdf'
 CLEANUP_AFTER_PROCESSING = True  # Set to False for debugging
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1MB reads from the request stream
+# /analyze-documents keeps its per-request files on tmpfs when available so they never hit the disk
+UPLOAD_TEMP_DIR = os.environ.get('UPLOAD_TEMP_DIR', '/dev/shm' if os.path.isdir('/dev/shm') else None)
+CACHE_FOLDER = 'app/cache'  # Extraction results keyed by extractor version and the SHA-256 of the PDF bytes
+CACHE_MAX_BYTES = 100 * 1024 * 1024  # Least recently used results are evicted above this
+CACHE_PRUNE_INTERVAL = 60  # Seconds between eviction passes
+# Each gunicorn worker has its own extraction pool, so the CPUs are shared between them;
+# gunicorn.conf.py keeps the worker count low so each share is more than one process
+EXTRACT_PROCESSES = int(os.environ.get(
+    'EXTRACT_PROCESSES', max(1, (os.cpu_count() or 1) // int(os.environ.get('WEB_CONCURRENCY', 1)))))
+
+# Spawned extraction processes re-run this module as __mp_main__ when it is started as a
+# script; they only need its functions, not the log listener or cache pruner
+IS_EXTRACTION_PROCESS = __name__ == '__mp_main__'
 
-# Setup logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('app.log'),
-        logging.StreamHandler()
-    ]
-)
+# Setup logging: request threads only enqueue records, a background listener writes them
+if not IS_EXTRACTION_PROCESS:
+    log_queue = queue.Queue(-1)
+    log_listener = QueueListener(log_queue, logging.FileHandler('app.log'), logging.StreamHandler())
+    logging.basicConfig(
+        level=os.environ.get('LOG_LEVEL', 'WARNING').upper(),  # LOG_LEVEL=INFO for per-request logs
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[QueueHandler(log_queue)],
+        force=True  # pdf_extractor configures the root logger on import
+    )
+    log_listener.start()
+    atexit.register(log_listener.stop)
 logger = logging.getLogger(__name__)
 
+# Digest of the extractor's source, so results cached by other extractor code are never served
+with open(inspect.getsourcefile(PDFHeadingExtractor), 'rb') as f:
+    EXTRACTOR_VERSION = hashlib.sha256(f.read()).hexdigest()[:16]
+
+# The extractor keeps no per-document state, so one instance serves every request
+extractor = PDFHeadingExtractor()
+
+# /extract_batch, /analyze-documents and /batch-process extract their files in separate processes, since
+# the Python side of extraction is GIL-bound. The pool is created on first use, so processes
+# that never extract anything don't spawn one.
+_process_executor = None
+_process_executor_lock = threading.Lock()
+
+def get_process_executor():
+    """Return this process's extraction pool, creating it on first use"""
+    global _process_executor
+    with _process_executor_lock:
+        if _process_executor is None:
+            # Spawned children don't inherit this process's threads or log queue; disabling
+            # levels below ours keeps pdf_extractor's DEBUG config quiet there
+            _process_executor = ProcessPoolExecutor(
+                max_workers=EXTRACT_PROCESSES,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=logging.disable,
+                initargs=(logging.getLogger().getEffectiveLevel() - 1,)
+            )
+        return _process_executor
+
+def discard_process_executor(executor):
+    """Forget a broken pool so the next get_process_executor call starts a fresh one"""
+    global _process_executor
+    with _process_executor_lock:
+        if _process_executor is executor:
+            _process_executor = None
+
+def submit_extraction(fn, *args):
+    """Submit fn to the extraction pool, replacing the pool whenever a crashed child breaks it"""
+    executor = get_process_executor()
+    try:
+        future = executor.submit(fn, *args)
+    except BrokenProcessPool:
+        # Broken by another request's crash; nothing of ours ran yet, so retry on a new pool
+        discard_process_executor(executor)
+        executor = get_process_executor()
+        future = executor.submit(fn, *args)
+    
+    def discard_if_broken(done):
+        # A child killed by a segfault or the OOM killer breaks the whole pool; only the
+        # requests with work in flight fail, later ones get a new pool
+        if not done.cancelled() and isinstance(done.exception(), BrokenProcessPool):
+            discard_process_executor(executor)
+    
+    future.add_done_callback(discard_if_broken)
+    return future
+
 # Ensure directories exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+os.makedirs(CACHE_FOLDER, exist_ok=True)
 
 def allowed_file(filename):
     """Check if the uploaded file has an allowed extension"""
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    return len(filename) > len(ALLOWED_SUFFIX) and filename[-len(ALLOWED_SUFFIX):].lower() == ALLOWED_SUFFIX
 
 def generate_unique_filename(original_filename):
     """Generate a unique filename to prevent conflicts"""
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    unique_id = str(uuid.uuid4())[:8]
-    name, ext = os.path.splitext(secure_filename(original_filename))
-    return f"{timestamp}_{unique_id}_{name}{ext}"
+    unique_name = f"{time.time_ns()}_{os.urandom(4).hex()}"
+    if CLEANUP_AFTER_PROCESSING:
+        # Files are deleted right after processing, so only uniqueness matters
+        return f"{unique_name}.pdf"
+    return f"{unique_name}_{secure_filename(original_filename)}"
+
+def utc_timestamp():
+    """ISO-8601 UTC timestamp for response metadata"""
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+
+def stream_upload(**targets):
+    """Stream multipart fields into their targets without Werkzeug's form parser"""
+    parser = StreamingFormDataParser(headers=request.headers)
+    for field_name, target in targets.items():
+        parser.register(field_name, target)
+    while True:
+        chunk = request.stream.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        parser.data_received(chunk)
+
+class SingleValueTarget(ValueTarget):
+    """In-memory target that counts its parts; ValueTarget alone joins repeated fields into one value"""
+    
+    def __init__(self):
+        super().__init__()
+        self.part_count = 0
+    
+    def on_start(self):
+        self.part_count += 1
+    
+    def on_data_received(self, chunk):
+        # Later parts are drained without buffering; the request is rejected
+        if self.part_count == 1:
+            super().on_data_received(chunk)
 
-def validate_pdf_file(file_path):
-    """Validate PDF file (non-empty, within page limit)"""
+class PDFDirectoryTarget(BaseTarget):
+    """Streams each uploaded PDF part straight to a uniquely named file in a temp directory"""
+    
+    def __init__(self):
+        super().__init__()
+        self.directory = None
+        self.file_count = 0
+        self.saved = []  # (original filename, path on disk) in upload order
+        self._fd = None
+    
+    def on_start(self):
+        if self.multipart_filename is None:
+            return
+        self.file_count += 1
+        # Parts that will be rejected are drained without touching the disk
+        if self.file_count > MAX_BATCH_FILES or not allowed_file(self.multipart_filename):
+            return
+        # The temp dir is only created once there is a PDF to write
+        if self.directory is None:
+            self.directory = tempfile.mkdtemp(dir=UPLOAD_TEMP_DIR)
+        file_path = os.path.join(self.directory, generate_unique_filename(self.multipart_filename))
+        self._fd = open(file_path, 'wb', buffering=UPLOAD_CHUNK_SIZE)
+        self.saved.append((self.multipart_filename, file_path))
+    
+    def on_data_received(self, chunk):
+        if self._fd:
+            self._fd.write(chunk)
+    
+    def on_finish(self):
+        if self._fd:
+            self._fd.close()
+            self._fd = None
+    
+    def cleanup(self):
+        """Close any half-written file and remove the temp directory"""
+        self.on_finish()
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+def validate_pdf_bytes(data):
+    """Reject non-PDF uploads from the header/trailer bytes before any PDF parsing"""
+    if b'%PDF-' not in data[:1024]:
+        return False, "Invalid PDF file: missing %PDF- header"
+    
+    if b'%%EOF' not in data[-1024:]:
+        return False, "Invalid PDF file: missing %%EOF trailer"
+    
+    return True, None
+
+def cached_result_path(digest):
+    """Path of the cached extraction result for a PDF digest under the running extractor"""
+    # Entries from older extractor versions are never hit again and age out through pruning
+    return os.path.join(CACHE_FOLDER, f"{EXTRACTOR_VERSION}_{digest}.json")
+
+def load_cached_result(digest):
+    """Return the cached extraction result for a PDF digest, or None on a miss"""
+    path = cached_result_path(digest)
     try:
-        doc = fitz.open(file_path)
-        page_count = len(doc)
-        doc.close()
-        
-        if page_count == 0:
-            return False, "PDF file appears to be empty"
-        
-        if page_count > 50:
-            return False, f"PDF has {page_count} pages, exceeding the 50-page limit"
-        
-        return True, None
-    except Exception as e:
-        return False, f"Invalid PDF file: {str(e)}"
+        with open(path, 'rb') as f:
+            result = orjson.loads(f.read())
+        os.utime(path)  # Mark as recently used for eviction
+    except (OSError, orjson.JSONDecodeError):
+        return None
+    return result
+
+def store_cached_result(digest, result):
+    """Write an extraction result to the cache; the rename makes it visible atomically"""
+    path = cached_result_path(digest)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(orjson.dumps(result))
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning("Could not cache extraction result: %s", e)
+
+def prune_result_cache():
+    """Delete least recently used cache entries until the cache fits in CACHE_MAX_BYTES"""
+    with os.scandir(CACHE_FOLDER) as it:
+        entries = []
+        for entry in it:
+            if entry.name.endswith('.json'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total_bytes = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_bytes <= CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass  # Already evicted by another worker
+        total_bytes -= size
+
+def run_cache_pruner():
+    """Background loop that keeps the result cache within its size budget"""
+    while True:
+        time.sleep(CACHE_PRUNE_INTERVAL)
+        try:
+            prune_result_cache()
+        except OSError as e:
+            logger.warning("Result cache eviction failed: %s", e)
+
+if not IS_EXTRACTION_PROCESS:
+    threading.Thread(target=run_cache_pruner, name='cache-pruner', daemon=True).start()
+
+def outline_response(result, filename):
+    """Response body and status for an extracted outline"""
+    # Log extraction statistics
+    heading_count = len(result.get('outline', []))
+    logger.info("Extraction successful: %d headings found", heading_count)
+    
+    return {
+        'title': result['title'],
+        'outline': result['outline'],
+        'metadata': {
+            'total_headings': heading_count,
+            'original_filename': filename,
+            'timestamp': utc_timestamp()
+        }
+    }, 200
+
+def prepare_pdf_bytes(pdf_bytes, filename):
+    """Cache lookup and byte-level checks for an upload; response is None if it still needs extracting"""
+    # Keep a copy of the upload on disk only when debugging
+    if not CLEANUP_AFTER_PROCESSING:
+        filepath = os.path.join(UPLOAD_FOLDER, generate_unique_filename(filename))
+        with open(filepath, 'wb') as f:
+            f.write(pdf_bytes)
+        logger.info("Kept uploaded file for debugging: %s", filepath)
+    
+    # Re-uploads of the same file are answered from the result cache
+    digest = hashlib.sha256(pdf_bytes).hexdigest()
+    result = load_cached_result(digest)
+    if result is not None:
+        logger.info("Extraction cache hit: %s", digest)
+        return digest, outline_response(result, filename)
+    
+    # Cheap byte-level check before handing the file to PyMuPDF
+    is_valid, validation_error = validate_pdf_bytes(pdf_bytes)
+    if not is_valid:
+        logger.error("PDF validation failed: %s", validation_error)
+        return digest, ({'error': 'Invalid PDF', 'message': validation_error}, 400)
+    
+    return digest, None
+
+def finish_extraction(digest, filename, extract):
+    """Run extract() and turn its result into (response body, status code), caching successes"""
+    # Page limits are checked by the extractor while it parses the PDF
+    try:
+        result = extract()
+    except PDFValidationError as validation_error:
+        logger.error("PDF validation failed: %s", validation_error)
+        return {'error': 'Invalid PDF', 'message': str(validation_error)}, 400
+    except BrokenProcessPool:
+        logger.error("Extraction process crashed while extracting %s", filename)
+        return {'error': 'Extraction failed', 'message': 'The extraction process crashed'}, 500
+    except PDFExtractionError as extraction_error:
+        # Not cached, so a re-upload of the PDF is extracted again
+        logger.error("PDF extraction failed: %s", extraction_error)
+        return {'error': 'Extraction failed', 'message': 'Failed to extract headings from the PDF'}, 500
+    
+    # Validate result
+    if not result or 'title' not in result or 'outline' not in result:
+        logger.error("PDF extraction returned invalid result")
+        return {'error': 'Extraction failed', 'message': 'Failed to extract headings from the PDF'}, 500
+    
+    store_cached_result(digest, {'title': result['title'], 'outline': result['outline']})
+    return outline_response(result, filename)
+
+def extract_pdf_bytes(pdf_bytes, filename):
+    """Validate and extract one uploaded PDF, returning (response body, status code)"""
+    digest, response = prepare_pdf_bytes(pdf_bytes, filename)
+    if response is not None:
+        return response
+    # PDFs that carry their own bookmark outline skip the heading heuristics
+    return finish_extraction(digest, filename, functools.partial(
+        extractor.process_pdf_bytes, pdf_bytes, filename, max_pages=MAX_PDF_PAGES, use_embedded_toc=True))
+
+@app.before_request
+def reject_oversized_request():
+    """Reject uploads from the Content-Length header before any body is read"""
+    content_length = request.content_length
+    if content_length is not None and content_length > app.config['MAX_CONTENT_LENGTH']:
+        return jsonify({
+            'error': 'File too large',
+            'message': 'The uploaded file exceeds the maximum size limit of 50MB'
+        }), 413
 
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({
         'status': 'healthy',
-        'timestamp': datetime.now().isoformat(),
         'service': 'PDF Extractor API'
     })
 
@@ -77,110 +382,145 @@ def health_check():
 def extract_outline():
     """Extract structured outline from PDF (matches Upload.jsx)"""
     try:
-        if 'pdf' not in request.files:
+        # Keep the upload in memory; it is bounded by MAX_CONTENT_LENGTH
+        try:
+            upload = SingleValueTarget()
+            stream_upload(pdf=upload)
+        except ParseFailedException as e:
+            logger.warning("Malformed multipart request: %s", e)
+            return jsonify({'error': 'No file provided', 'message': 'Please upload a PDF file using the "pdf" field'}), 400
+        
+        if upload.multipart_filename is None:
             logger.warning("Request missing 'pdf' file field")
             return jsonify({'error': 'No file provided', 'message': 'Please upload a PDF file using the "pdf" field'}), 400
         
-        file = request.files['pdf']
-        if file.filename == '':
+        if upload.multipart_filename == '':
             logger.warning("Empty filename in request")
             return jsonify({'error': 'No file selected', 'message': 'Please select a PDF file to upload'}), 400
         
-        if not allowed_file(file.filename):
-            logger.warning(f"Invalid file type: {file.filename}")
-            return jsonify({'error': 'Invalid file type', 'message': 'Only PDF files are allowed'}), 400
-        
-        # Generate unique filename and save file
-        unique_filename = generate_unique_filename(file.filename)
-        filepath = os.path.join(UPLOAD_FOLDER, unique_filename)
-        logger.info(f"Saving uploaded file: {file.filename} -> {unique_filename}")
-        file.save(filepath)
+        if upload.part_count > 1:
+            logger.warning("Request has %d 'pdf' parts", upload.part_count)
+            return jsonify({'error': 'Too many files', 'message': 'Upload one PDF per request, or use /extract_batch for several'}), 400
         
-        # Validate PDF file
-        is_valid, validation_error = validate_pdf_file(filepath)
-        if not is_valid:
-            logger.error(f"PDF validation failed: {validation_error}")
-            if CLEANUP_AFTER_PROCESSING:
-                os.remove(filepath)
-            return jsonify({'error': 'Invalid PDF', 'message': validation_error}), 400
+        if not allowed_file(upload.multipart_filename):
+            logger.warning("Invalid file type: %s", upload.multipart_filename)
+            return jsonify({'error': 'Invalid file type', 'message': 'Only PDF files are allowed'}), 400
         
-        # Extract outline
-        extractor = PDFExtractor()
-        result = extractor.extract_outline(filepath)
+        pdf_bytes = upload.value
+        logger.info("Received uploaded file: %s (%d bytes)", upload.multipart_filename, len(pdf_bytes))
         
-        # Validate result
-        if not result or 'title' not in result or 'outline' not in result:
-            logger.error("PDF extraction returned invalid result")
-            if CLEANUP_AFTER_PROCESSING:
-                os.remove(filepath)
-            return jsonify({'error': 'Extraction failed', 'message': 'Failed to extract headings from the PDF'}), 500
+        response, status = extract_pdf_bytes(pdf_bytes, upload.multipart_filename)
+        return jsonify(response), status
+    
+    except Exception as e:
+        logger.error("Unexpected error during processing: %s", e)
+        return jsonify({'error': 'Processing failed', 'message': str(e)}), 500
+
+@app.route('/extract_batch', methods=['POST'])
+def extract_batch():
+    """Extract outlines from several PDFs sent as repeated "pdf" fields"""
+    try:
+        files = request.files.getlist('pdf')
+        if not files:
+            logger.warning("Request missing 'pdf' file fields")
+            return jsonify({'error': 'No files provided', 'message': 'Please upload PDF files using the "pdf" field'}), 400
         
-        # Log extraction statistics
-        heading_count = len(result.get('outline', []))
-        logger.info(f"Extraction successful: {heading_count} headings found")
+        if len(files) > MAX_BATCH_FILES:
+            return jsonify({'error': 'Too many files', 'message': f'Maximum {MAX_BATCH_FILES} files allowed'}), 400
         
-        # Prepare response
-        response = {
-            'title': result['title'],
-            'outline': result['outline'],
-            'metadata': {
-                'total_headings': heading_count,
-                'original_filename': file.filename,
-                'timestamp': datetime.now().isoformat()
-            }
-        }
+        # Files that need extracting go to the process pool; results keep the upload order
+        results = []
+        pending = []
+        for file in files:
+            entry = {'filename': file.filename}
+            results.append(entry)
+            if not allowed_file(file.filename):
+                logger.warning("Invalid file type: %s", file.filename)
+                entry.update({'status': 400, 'error': 'Invalid file type', 'message': 'Only PDF files are allowed'})
+                continue
+            pdf_bytes = file.stream.read()
+            digest, response = prepare_pdf_bytes(pdf_bytes, file.filename)
+            if response is not None:
+                entry.update(response[0], status=response[1])
+            else:
+                future = submit_extraction(process_pdf_bytes_for_outline, pdf_bytes,
+                                           file.filename, MAX_PDF_PAGES)
+                pending.append((entry, digest, future))
         
-        # Clean up uploaded file
-        if CLEANUP_AFTER_PROCESSING:
-            os.remove(filepath)
-            logger.info(f"Cleaned up file: {filepath}")
+        for entry, digest, future in pending:
+            body, status = finish_extraction(digest, entry['filename'], future.result)
+            entry.update(body, status=status)
         
-        return jsonify(response)
+        logger.info("Batch extraction finished: %d files", len(results))
+        return jsonify(results)
     
     except Exception as e:
-        logger.error(f"Unexpected error during processing: {str(e)}")
-        if filepath and os.path.exists(filepath) and CLEANUP_AFTER_PROCESSING:
-            os.remove(filepath)
+        logger.error("Unexpected error during batch processing: %s", e)
         return jsonify({'error': 'Processing failed', 'message': str(e)}), 500
 
 @app.route('/analyze-documents', methods=['POST'])
 def analyze_documents():
     """Persona-driven document intelligence"""
     try:
-        persona = request.form.get('persona')
-        job_to_be_done = request.form.get('job_to_be_done')
-        
-        if not persona or not job_to_be_done:
-            return jsonify({'error': 'Persona and job-to-be-done are required'}), 400
-        
-        files = request.files.getlist('files')
-        if not files or len(files) == 0:
-            return jsonify({'error': 'No files provided'}), 400
-        
-        if len(files) > 10:
-            return jsonify({'error': 'Maximum 10 files allowed'}), 400
-        
-        temp_dir = tempfile.mkdtemp()
-        file_paths = []
+        # PDF parts are written to their final temp paths as they arrive,
+        # without Werkzeug spooling them to a temporary file first
+        persona_target = ValueTarget()
+        job_target = ValueTarget()
+        uploads = PDFDirectoryTarget()
         
         try:
-            for file in files:
-                if allowed_file(file.filename):
-                    filename = generate_unique_filename(file.filename)
-                    filepath = os.path.join(temp_dir, filename)
-                    file.save(filepath)
-                    file_paths.append(filepath)
+            try:
+                stream_upload(persona=persona_target, job_to_be_done=job_target, files=uploads)
+            except ParseFailedException as e:
+                logger.warning("Malformed multipart request: %s", e)
+                return jsonify({'error': 'Persona and job-to-be-done are required'}), 400
+            
+            try:
+                persona = persona_target.value.decode('utf-8')
+                job_to_be_done = job_target.value.decode('utf-8')
+            except UnicodeDecodeError:
+                logger.warning("Persona or job-to-be-done is not valid UTF-8")
+                return jsonify({'error': 'Persona and job-to-be-done must be valid UTF-8 text'}), 400
+            
+            if not persona or not job_to_be_done:
+                return jsonify({'error': 'Persona and job-to-be-done are required'}), 400
+            
+            if uploads.file_count == 0:
+                return jsonify({'error': 'No files provided'}), 400
+            
+            if uploads.file_count > MAX_BATCH_FILES:
+                return jsonify({'error': f'Maximum {MAX_BATCH_FILES} files allowed'}), 400
             
-            if not file_paths:
+            if not uploads.saved:
                 return jsonify({'error': 'No valid PDF files found'}), 400
             
-            extractor = PDFExtractor()
-            result = extractor.analyze_documents(file_paths, persona, job_to_be_done)
+            # Extract every file in parallel, then rank the sections across all of them
+            file_paths = [file_path for _, file_path in uploads.saved]
+            futures = [submit_extraction(process_pdf_for_analysis, file_path) for file_path in file_paths]
+            try:
+                pdf_results = [future.result() for future in futures]
+            except BrokenProcessPool:
+                logger.error("Extraction process crashed during document analysis")
+                return jsonify({'error': 'Analysis failed: the extraction process crashed'}), 500
+            document_names = [original_name for original_name, _ in uploads.saved]
+            for document_name, pdf_result in zip(document_names, pdf_results):
+                pdf_result['document'] = document_name
             
-            return jsonify(result)
+            analysis = extractor.analyze_documents(pdf_results, persona, job_to_be_done)
+            
+            return jsonify({
+                'metadata': {
+                    'input_documents': document_names,
+                    'persona': persona,
+                    'job_to_be_done': job_to_be_done,
+                    'timestamp': utc_timestamp()
+                },
+                'extracted_sections': analysis['extracted_sections'],
+                'subsection_analysis': analysis['subsection_analysis']
+            })
         
         finally:
-            shutil.rmtree(temp_dir, ignore_errors=True)
+            uploads.cleanup()
     
     except Exception as e:
         return jsonify({'error': f'Analysis failed: {str(e)}'}), 500
@@ -192,36 +532,43 @@ def batch_process():
         input_dir = UPLOAD_FOLDER
         output_dir = OUTPUT_FOLDER
         
-        if not os.path.exists(input_dir):
+        # One scandir pass; a missing directory surfaces as FileNotFoundError.
+        # DirEntry.is_file() uses the dirent type, so no per-file stat is made.
+        try:
+            with os.scandir(input_dir) as it:
+                entries = [entry for entry in it if entry.is_file() and allowed_file(entry.name)]
+        except FileNotFoundError:
             return jsonify({'error': 'Input directory not found'}), 404
         
-        extractor = PDFExtractor()
+        # Extract all files in parallel; results are collected in directory order
+        pending = [(entry.name, submit_extraction(process_pdf_for_outline, entry.path))
+                   for entry in entries]
         processed_files = []
         
-        for filename in os.listdir(input_dir):
-            if filename.lower().endswith('.pdf'):
-                input_path = os.path.join(input_dir, filename)
-                output_filename = filename.replace('.pdf', '.json')
-                output_path = os.path.join(output_dir, output_filename)
+        for filename, future in pending:
+            # Swap only the extension; str.replace missed '.PDF' and touched '.pdf' mid-name
+            output_filename = filename[:-len(ALLOWED_SUFFIX)] + '.json'
+            output_path = os.path.join(output_dir, output_filename)
+            
+            try:
+                result = future.result()
+                # orjson writes UTF-8 bytes in one call, like json.dump(..., ensure_ascii=False)
+                with open(output_path, 'wb') as f:
+                    f.write(orjson.dumps(result, option=orjson.OPT_INDENT_2))
+                
+                processed_files.append({
+                    'input': filename,
+                    'output': output_filename,
+                    'status': 'success'
+                })
                 
-                try:
-                    result = extractor.extract_outline(input_path)
-                    with open(output_path, 'w', encoding='utf-8') as f:
-                        json.dump(result, f, indent=2, ensure_ascii=False)
-                    
-                    processed_files.append({
-                        'input': filename,
-                        'output': output_filename,
-                        'status': 'success'
-                    })
-                    
-                except Exception as e:
-                    processed_files.append({
-                        'input': filename,
-                        'output': output_filename,
-                        'status': 'error',
-                        'error': str(e)
-                    })
+            except Exception as e:
+                processed_files.append({
+                    'input': filename,
+                    'output': output_filename,
+                    'status': 'error',
+                    'error': str(e)
+                })
         
         return jsonify({
             'message': f'Processed {len(processed_files)} files',
@@ -245,7 +592,7 @@ def not_found(e):
     return jsonify({
         'error': 'Endpoint not found',
         'message': 'The requested endpoint does not exist',
-        'available_endpoints': ['/extract', '/health', '/analyze-documents', '/batch-process']
+        'available_endpoints': ['/extract', '/extract_batch', '/health', '/analyze-documents', '/batch-process']
     }), 404
 
 @app.errorhandler(405)
@@ -259,15 +606,20 @@ def method_not_allowed(e):
 @app.errorhandler(500)
 def internal_error(e):
     """Handle 500 errors"""
-    logger.error(f"Internal server error: {str(e)}")
+    logger.error("Internal server error: %s", e)
     return jsonify({
         'error': 'Internal server error',
         'message': 'An unexpected error occurred on the server'
     }), 500
 
 if __name__ == '__main__':
+    # The built-in server is for local development only; production runs under
+    # gunicorn (gunicorn -c gunicorn.conf.py app:app)
+    if os.environ.get('FLASK_ENV') != 'development':
+        raise SystemExit("Run the API with 'gunicorn -c gunicorn.conf.py app:app', "
+                         "or set FLASK_ENV=development to use the development server")
     logger.info("Starting PDF Extractor API")
-    logger.info(f"Upload folder: {UPLOAD_FOLDER}")
-    logger.info(f"Max file size: {app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)}MB")
-    logger.info(f"Cleanup after processing: {CLEANUP_AFTER_PROCESSING}")
+    logger.info("Upload folder: %s", UPLOAD_FOLDER)
+    logger.info("Max file size: %dMB", app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024))
+    logger.info("Cleanup after processing: %s", CLEANUP_AFTER_PROCESSING)
     app.run(debug=False, host='0.0.0.0', port=5000, threaded=True)
@@ -0,0 +1,22 @@
+# Gunicorn configuration for the PDF Extractor API
+# Run from this directory: gunicorn -c gunicorn.conf.py app:app
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+
+# Multi-file routes extract in each worker's process pool, and app.py gives every pool
+# cpu_count // workers processes. A few workers keep those pools wide, so a 10-file request
+# is spread over the cores; /extract runs in the worker itself, so more workers would mean
+# more concurrent single-file extractions but narrower pools. Threads cover the socket I/O.
+workers = int(os.environ.get('WEB_CONCURRENCY', min(2, multiprocessing.cpu_count())))
+os.environ['WEB_CONCURRENCY'] = str(workers)
+worker_class = 'gthread'
+threads = 4
+
+# Recycle workers periodically to release memory held by PyMuPDF
+max_requests = 1000
+max_requests_jitter = 100
+
+# Large PDFs can take a while to extract
+timeout = 120
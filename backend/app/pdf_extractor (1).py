@@ -1,27 +1,62 @@
 import fitz  # PyMuPDF
+import ahocorasick
 import json
+import orjson
 import re
 import os
 from collections import defaultdict, Counter
-from typing import Dict, List, Optional
-import unicodedata
-import nltk
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
-from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+import time
 import logging
+import functools
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
 
 # Setup logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Ensure NLTK data is available
-try:
-    nltk.data.find('tokenizers/punkt')
-    nltk.data.find('corpora/stopwords')
-except LookupError:
-    nltk.download('punkt', quiet=True)
-    nltk.download('stopwords', quiet=True)
+# NLTK's English stop word list, inlined so importing this module needs no corpus lookup or download
+STOP_WORDS = frozenset("""
+    i me my myself we our ours ourselves you you're you've you'll you'd your yours yourself
+    yourselves he him his himself she she's her hers herself it it's its itself they them
+    their theirs themselves what which who whom this that that'll these those am is are was
+    were be been being have has had having do does did doing a an the and but if or because
+    as until while of at by for with about against between into through during before after
+    above below to from up down in out on off over under again further then once here there
+    when where why how all any both each few more most other some such no nor not only own
+    same so than too very s t can will just don don't should should've now d ll m o re ve y
+    ain aren aren't couldn couldn't didn didn't doesn doesn't hadn hadn't hasn hasn't haven
+    haven't isn isn't ma mightn mightn't mustn mustn't needn needn't shan shan't shouldn
+    shouldn't wasn wasn't weren weren't won won't wouldn wouldn't
+""".split())
+
+# Word tokens for the bag-of-words relevance score. Runs joined by '.' or '-' ("4.1",
+# "state-of-the-art") stay one token and are then dropped as non-alphanumeric, as with
+# NLTK's word_tokenize, so no Punkt model is needed. An apostrophe splits the word, so
+# "company's" keeps "company" and the "s" is dropped as a stop word.
+WORD_RE = re.compile(r"[^\W_]+(?:[.-][^\W_]+)*")
+
+# Characters of a text that score_relevance reads
+RELEVANCE_TEXT_LIMIT = 2000
+
+# get_text("dict") flags without TEXT_PRESERVE_IMAGES
+TEXT_DICT_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+
+class PDFValidationError(Exception):
+    """Raised when a PDF is rejected before heading extraction"""
+
+class InvalidPDFError(PDFValidationError):
+    """Raised when PyMuPDF cannot open the file"""
+
+class EmptyPDFError(PDFValidationError):
+    """Raised when the PDF has no pages"""
+
+class TooManyPagesError(PDFValidationError):
+    """Raised when the PDF exceeds the page limit"""
+
+class PDFExtractionError(Exception):
+    """Raised instead of returning an empty result when extraction of an accepted PDF fails"""
 
 class PDFHeadingExtractor:
     def __init__(self):
@@ -90,6 +125,21 @@ class PDFHeadingExtractor:
             }
         }
         
+        self.persona_weights = {
+            'phd researcher': {'high': 20, 'medium': 10, 'low': 5},
+            'investment analyst': {'high': 20, 'medium': 10, 'low': 5},
+            'undergraduate student': {'high': 20, 'medium': 10, 'low': 5},
+            'travel planner': {'high': 30, 'medium': 15, 'low': 5}
+        }
+        
+        # Job-to-be-done keyword lists and the weight each keyword found adds
+        self.job_keywords = {
+            'literature review': (['methodology', 'approach', 'study', 'research', 'analysis', 'literature', 'references'], 20),
+            'financial': (['revenue', 'profit', 'income', 'financial', 'market', 'investment', 'forecast'], 20),
+            'study': (['concept', 'principle', 'definition', 'example', 'theory', 'tutorial'], 20),
+            'travel': (['itinerary', 'destination', 'schedule', 'accommodation', 'activities'], 25)
+        }
+        
         self.exclude_patterns = [
             r'^\d+\s*[A-Z\s]+$',  # e.g., "3735 PARKWAY"
             r'^[A-Z]+:.*$',  # e.g., "ADDRESS:", "RSVP:"
@@ -107,44 +157,90 @@ class PDFHeadingExtractor:
             r'^[0-9]{8,}$',  # Long number strings
             r'^\s*[-•]\s*.*$',  # List items
             r'^(Header|Footer)\s*\d*$',  # Header/Footer
-            r'^(.)\1{3,}$',  # Repeated characters
+            r'^(?P<repeat>.)(?P=repeat){3,}$',  # Repeated characters (named so it survives being joined below)
         ]
+        
+        # Compile every pattern once; the per-element checks below run thousands of times per PDF.
+        # Only "does any pattern match" matters, so each list becomes a single alternation.
+        self.heading_re = re.compile('|'.join(f'(?:{p})' for p in self.heading_patterns), re.IGNORECASE)
+        self.exclude_re = re.compile('|'.join(f'(?:{p})' for p in self.exclude_patterns), re.IGNORECASE)
+        self.whitespace_re = re.compile(r'\s+')
+        self.noise_char_re = re.compile(r'[^\w\s\-\.\,\:\;\!\?\(\)\[\]\"\'\/]')
+        self.repeat_char_re = re.compile(r'(.)\1{3,}')
+        self.boilerplate_line_re = re.compile(r'^(Page\s+\d+|Header|Footer|Copyright.*)$', re.IGNORECASE)
+        self.number_re = re.compile(r'\d+')
+        self.enumeration_re = re.compile(r'^\d+\.|^[A-Z]\.|^[IVXLCDM]+\.')
+        # Code point ranges whose Unicode names start with "CJK" / "CYRILLIC"
+        self.cjk_char_re = re.compile('[\u2e80-\u2eff\u31c0-\u31ef\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff'
+                                      '\U00020000-\U0002fa1f\U00030000-\U000323af]')
+        self.cyrillic_char_re = re.compile('[\u0400-\u0482\u048a-\u052f\u1c80-\u1c8f\u1d2b\ua640-\ua66e\ua67e-\ua69b]')
+        
+        # Running headers, footers and stock headings repeat the same text across pages and
+        # documents; text_features depends only on the text, so remember recent results
+        self.text_features = functools.lru_cache(maxsize=1024)(self.text_features)
+        
+        # Aho-Corasick automata find every keyword contained in a text in one linear pass
+        self.heading_keyword_automata = {
+            lang: self.build_keyword_automaton({keyword: keyword for keyword in keywords})
+            for lang, keywords in self.heading_keywords.items()
+        }
+        self.persona_keyword_automata = {}
+        for persona, categories in self.persona_keywords.items():
+            # A keyword listed under several categories earns each category's weight
+            keyword_weights = defaultdict(int)
+            for category, keywords in categories.items():
+                for keyword in keywords:
+                    keyword_weights[keyword] += self.persona_weights[persona][category]
+            self.persona_keyword_automata[persona] = self.build_keyword_automaton(
+                {keyword: (keyword, weight) for keyword, weight in keyword_weights.items()})
+        self.job_keyword_automata = {
+            job: self.build_keyword_automaton({keyword: (keyword, weight) for keyword in keywords})
+            for job, (keywords, weight) in self.job_keywords.items()
+        }
+
+    @staticmethod
+    def build_keyword_automaton(keyword_values: Dict[str, object]) -> ahocorasick.Automaton:
+        """Build an Aho-Corasick automaton reporting the value of each keyword found"""
+        automaton = ahocorasick.Automaton()
+        for keyword, value in keyword_values.items():
+            automaton.add_word(keyword, value)
+        automaton.make_automaton()
+        return automaton
+
+    def contains_heading_keyword(self, text_lower: str, lang: str) -> bool:
+        """Check whether lowercased text contains any heading keyword for the language"""
+        automaton = self.heading_keyword_automata.get(lang, self.heading_keyword_automata['en'])
+        return next(automaton.iter(text_lower), None) is not None
+
+    def keyword_score(self, automaton: ahocorasick.Automaton, text_lower: str) -> float:
+        """Sum the weights of the distinct keywords found; each scores once, however often it occurs"""
+        matches = set(match for _, match in automaton.iter(text_lower))
+        return sum(weight for _, weight in matches)
 
     def clean_text(self, text: str) -> str:
         """Clean and normalize text, handling OCR noise"""
         if not text:
             return ""
-        text = re.sub(r'\s+', ' ', text.strip())
-        text = re.sub(r'[^\w\s\-\.\,\:\;\!\?\(\)\[\]\"\'\/]', '', text)
-        text = re.sub(r'(.)\1{3,}', r'\1', text)
-        # Remove headers/footers and repetitive lines
-        lines = text.split('\n')
-        cleaned_lines = []
-        prev_line = None
-        count = 0
-        for line in lines:
-            line = line.strip()
-            if line == prev_line:
-                count += 1
-                if count > 1:
-                    continue
-            else:
-                count = 1
-                prev_line = line
-            if not re.match(r'^(Page\s+\d+|Header|Footer|Copyright.*)$', line, re.IGNORECASE):
-                cleaned_lines.append(line)
-        return ' '.join(cleaned_lines).strip()
-
-    def is_excluded_text(self, text: str) -> bool:
-        """Check if text should be excluded"""
+        text = self.whitespace_re.sub(' ', text.strip())
+        text = self.noise_char_re.sub('', text)
+        text = self.repeat_char_re.sub(r'\1', text).strip()
+        # Whitespace, newlines included, is collapsed above, so the text is a single line
+        if self.boilerplate_line_re.match(text):
+            return ""
+        return text
+
+    def is_excluded_text(self, text: str, word_count: Optional[int] = None) -> bool:
+        """Check if text should be excluded (its word count may be precomputed)"""
         if not text or len(text.strip()) < 2:
             return True
-        for pattern in self.exclude_patterns:
-            if re.match(pattern, text, re.IGNORECASE):
+        if self.exclude_re.match(text):
+            # These per-element debug lines run thousands of times per PDF; skip building them unless needed
+            if logger.isEnabledFor(logging.DEBUG):
                 logger.debug(f"Excluded by pattern: '{text}'")
-                return True
-        word_count = len(text.split())
-        number_count = len(re.findall(r'\d+', text))
+            return True
+        if word_count is None:
+            word_count = len(text.split())
+        number_count = len(self.number_re.findall(text))
         if word_count > 0 and number_count / word_count > 0.6:
             return True
         if word_count > 30:
@@ -153,36 +249,51 @@ class PDFHeadingExtractor:
 
     def detect_language(self, text: str) -> str:
         """Detect language based on character scripts"""
-        scripts = defaultdict(int)
-        for char in text:
-            script = unicodedata.name(char, '').split()[0] if unicodedata.name(char, '') else 'UNKNOWN'
-            scripts[script] += 1
-        if scripts.get('CJK', 0) > len(text) * 0.3:
+        if text.isascii():  # no CJK or Cyrillic to count
+            return 'en'
+        if len(self.cjk_char_re.findall(text)) > len(text) * 0.3:
             return 'ja'
-        elif scripts.get('CYRILLIC', 0) > len(text) * 0.3:
+        elif len(self.cyrillic_char_re.findall(text)) > len(text) * 0.3:
             return 'ru'
         return 'en'
 
+    def text_features(self, text: str) -> Dict:
+        """Run every text check used by heading detection, scoring and title selection once"""
+        word_count = len(text.split())
+        if self.is_excluded_text(text, word_count):
+            return {'excluded': True}
+        return {
+            'excluded': False,
+            'pattern_match': bool(self.heading_re.match(text)),
+            'keyword_match': self.contains_heading_keyword(text.lower(), self.detect_language(text)),
+            'is_upper': text.isupper(),
+            'is_title': text.istitle(),
+            'word_count': word_count,
+            'enumerated': bool(self.enumeration_re.match(text))
+        }
+
+    def get_text_features(self, element: Dict) -> Dict:
+        """Return the element's text features, computing and storing them on first use"""
+        features = element.get('features')
+        if features is None:
+            features = element['features'] = self.text_features(element.get('text', ''))
+        return features
+
     def is_potential_heading(self, element: Dict) -> bool:
         """Check if element could be a heading"""
-        text = element['text']
+        features = self.get_text_features(element)
         font_info = element.get('font_info', {})
-        if self.is_excluded_text(text):
+        if features['excluded']:
             return False
-        lang = self.detect_language(text)
-        for pattern in self.heading_patterns:
-            if re.match(pattern, text, re.IGNORECASE):
-                return True
+        if features['pattern_match']:
+            return True
         if (element.get('is_bold', False) or 
             font_info.get('size', 10) >= 9.5 or
-            text.isupper() or 
-            text.istitle()):
+            features['is_upper'] or 
+            features['is_title']):
+            return True
+        if features['keyword_match']:
             return True
-        text_lower = text.lower()
-        keywords = self.heading_keywords.get(lang, self.heading_keywords['en'])
-        for keyword in keywords:
-            if keyword in text_lower:
-                return True
         return False
 
     def analyze_font_distribution(self, text_elements: List[Dict]) -> Dict:
@@ -218,7 +329,9 @@ class PDFHeadingExtractor:
         font_info = element.get('font_info', {})
         font_size = font_info.get('size', 10)
         
-        if self.is_excluded_text(text):
+        # Computed once per element, usually already by is_potential_heading
+        features = self.get_text_features(element)
+        if features['excluded']:
             return 0.0
         
         # Font size scoring
@@ -238,22 +351,15 @@ class PDFHeadingExtractor:
             score += 15
         
         # Pattern matching
-        lang = self.detect_language(text)
-        for pattern in self.heading_patterns:
-            if re.match(pattern, text, re.IGNORECASE):
-                score += 50
-                break
+        if features['pattern_match']:
+            score += 50
         
         # Keyword matching (generic)
-        text_lower = text.lower()
-        keywords = self.heading_keywords.get(lang, self.heading_keywords['en'])
-        for keyword in keywords:
-            if keyword in text_lower:
-                score += 20
-                break
+        if features['keyword_match']:
+            score += 20
         
         # Length scoring
-        word_count = len(text.split())
+        word_count = features['word_count']
         if word_count <= 7:
             score += 50
         elif word_count <= 12:
@@ -264,11 +370,11 @@ class PDFHeadingExtractor:
             score -= (word_count - 20) * 0.3
         
         # Case and structure
-        if text.isupper():
+        if features['is_upper']:
             score += 25
-        elif text.istitle():
+        elif features['is_title']:
             score += 20
-        if re.match(r'^\d+\.', text) or re.match(r'^[A-Z]\.', text) or re.match(r'^[IVXLCDM]+\.', text):
+        if features['enumerated']:
             score += 25
         
         # Spatial analysis
@@ -281,13 +387,15 @@ class PDFHeadingExtractor:
             if space_before > 1.0 or space_after > 1.0:
                 score += 30
         
-        logger.debug(f"Heading: {text}, Score: {score}, Font Size: {font_size}, Bold: {element.get('is_bold', False)}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Heading: {text}, Score: {score}, Font Size: {font_size}, Bold: {element.get('is_bold', False)}")
         return score
 
     def determine_heading_level(self, score: float, font_size: float, font_analysis: Dict) -> Optional[str]:
         """Determine heading level with relaxed thresholds"""
         if score < 40:
-            logger.debug(f"Excluded as heading: Score: {score}, Font size: {font_size}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Excluded as heading: Score: {score}, Font size: {font_size}")
             return None
         if font_size >= font_analysis['h1_threshold'] or score >= 85:
             return 'H1'
@@ -297,7 +405,8 @@ class PDFHeadingExtractor:
             return 'H3'
         elif score >= 40:
             return 'H4'
-        logger.debug(f"Excluded as heading: Score: {score}, Font size: {font_size}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Excluded as heading: Score: {score}, Font size: {font_size}")
         return None
 
     def extract_title(self, text_elements: List[Dict], pdf_path: str) -> str:
@@ -313,7 +422,9 @@ class PDFHeadingExtractor:
             if element['page'] == 0:  # Focus on page 1
                 text = element['heading'] if 'heading' in element else element['text']
                 font_info = element.get('font_info', {})
-                if self.is_excluded_text(text):
+                # Sections carry the heading's source element, whose features are already computed
+                features = self.get_text_features(element.get('element') or element)
+                if features['excluded']:
                     continue
                 title_score = 0
                 font_size = font_info.get('size', 10)
@@ -324,7 +435,7 @@ class PDFHeadingExtractor:
                 elif font_size >= max_font_size - 1:
                     title_score += 40
                 title_score += max(0, 40 - i * 5)  # Prefer early elements
-                word_count = len(text.split())
+                word_count = features['word_count']
                 if 3 <= word_count <= 20:
                     title_score += 40
                 elif word_count <= 2:
@@ -352,27 +463,41 @@ class PDFHeadingExtractor:
                 })
         
         if title_candidates:
-            title_candidates.sort(key=lambda x: (-x['score'], x['position']))
-            selected_title = title_candidates[0]['text']
-            logger.info(f"Selected Title: {selected_title}, Score: {title_candidates[0]['score']}, Font Size: {title_candidates[0]['font_size']}, Position: {title_candidates[0]['position']}")
-            return selected_title
+            best = min(title_candidates, key=lambda x: (-x['score'], x['position']))
+            logger.info(f"Selected Title: {best['text']}, Score: {best['score']}, Font Size: {best['font_size']}, Position: {best['position']}")
+            return best['text']
         
         logger.warning(f"No title found for {pdf_path}, returning empty string")
         return ""
 
-    def score_relevance(self, text: str, persona: str, job_to_be_done: str) -> float:
-        """Score text relevance based on persona and job-to-be-done"""
+    def token_set(self, text: str) -> Set[str]:
+        """Lowercased alphanumeric tokens of text, minus English stop words"""
+        return set(word for word in WORD_RE.findall(text.lower())
+                   if word.isalnum() and word not in STOP_WORDS)
+
+    @staticmethod
+    def join_prefix(parts: List[str], limit: int) -> str:
+        """' '.join(parts)[:limit], without joining the parts past the limit"""
+        length = -1
+        for i, part in enumerate(parts):
+            length += len(part) + 1
+            if length >= limit:
+                return ' '.join(parts[:i + 1])[:limit]
+        return ' '.join(parts)
+
+    def score_relevance(self, text: str, persona: str, job_to_be_done: str,
+                        persona_tokens: Optional[Set[str]] = None,
+                        job_tokens: Optional[Set[str]] = None) -> float:
+        """Score text relevance based on persona and job-to-be-done (query token sets may be precomputed)"""
         if not text:
             return 0.0
         try:
-            text = text[:2000]
-            stop_words = set(stopwords.words('english'))
-            text_tokens = set(word.lower() for word in word_tokenize(text) 
-                            if word.isalnum() and word.lower() not in stop_words)
-            persona_tokens = set(word.lower() for word in word_tokenize(persona) 
-                               if word.isalnum() and word.lower() not in stop_words)
-            job_tokens = set(word.lower() for word in word_tokenize(job_to_be_done) 
-                           if word.isalnum() and word.lower() not in stop_words)
+            text = text[:RELEVANCE_TEXT_LIMIT]
+            text_tokens = self.token_set(text)
+            if persona_tokens is None:
+                persona_tokens = self.token_set(persona)
+            if job_tokens is None:
+                job_tokens = self.token_set(job_to_be_done)
             
             score = 0.0
             persona_overlap = len(text_tokens.intersection(persona_tokens))
@@ -382,65 +507,44 @@ class PDFHeadingExtractor:
             
             persona_lower = persona.lower()
             text_lower = text.lower()
+            persona_key = None
             if 'researcher' in persona_lower or 'phd' in persona_lower:
-                keywords = self.persona_keywords.get('phd researcher', {})
-                for weight_category, weight_value in [('high', 20), ('medium', 10), ('low', 5)]:
-                    for keyword in keywords.get(weight_category, []):
-                        if keyword in text_lower:
-                            score += weight_value
+                persona_key = 'phd researcher'
             elif 'analyst' in persona_lower or 'investment' in persona_lower:
-                keywords = self.persona_keywords.get('investment analyst', {})
-                for weight_category, weight_value in [('high', 20), ('medium', 10), ('low', 5)]:
-                    for keyword in keywords.get(weight_category, []):
-                        if keyword in text_lower:
-                            score += weight_value
+                persona_key = 'investment analyst'
             elif 'student' in persona_lower or 'undergraduate' in persona_lower:
-                keywords = self.persona_keywords.get('undergraduate student', {})
-                for weight_category, weight_value in [('high', 20), ('medium', 10), ('low', 5)]:
-                    for keyword in keywords.get(weight_category, []):
-                        if keyword in text_lower:
-                            score += weight_value
+                persona_key = 'undergraduate student'
             elif 'travel planner' in persona_lower:
-                keywords = self.persona_keywords.get('travel planner', {})
-                for weight_category, weight_value in [('high', 30), ('medium', 15), ('low', 5)]:
-                    for keyword in keywords.get(weight_category, []):
-                        if keyword in text_lower:
-                            score += weight_value
+                persona_key = 'travel planner'
+            if persona_key:
+                score += self.keyword_score(self.persona_keyword_automata[persona_key], text_lower)
             
             job_lower = job_to_be_done.lower()
+            job_key = None
             if 'literature review' in job_lower:
-                review_keywords = ['methodology', 'approach', 'study', 'research', 'analysis', 'literature', 'references']
-                for keyword in review_keywords:
-                    if keyword in text_lower:
-                        score += 20
+                job_key = 'literature review'
             elif 'revenue' in job_lower or 'financial' in job_lower:
-                financial_keywords = ['revenue', 'profit', 'income', 'financial', 'market', 'investment', 'forecast']
-                for keyword in financial_keywords:
-                    if keyword in text_lower:
-                        score += 20
+                job_key = 'financial'
             elif 'exam' in job_lower or 'study' in job_lower:
-                study_keywords = ['concept', 'principle', 'definition', 'example', 'theory', 'tutorial']
-                for keyword in study_keywords:
-                    if keyword in text_lower:
-                        score += 20
+                job_key = 'study'
             elif 'trip' in job_lower or 'travel' in job_lower:
-                travel_keywords = ['itinerary', 'destination', 'schedule', 'accommodation', 'activities']
-                for keyword in travel_keywords:
-                    if keyword in text_lower:
-                        score += 25
-            logger.debug(f"Relevance Score for text '{text[:50]}...': {score}")
+                job_key = 'travel'
+            if job_key:
+                score += self.keyword_score(self.job_keyword_automata[job_key], text_lower)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Relevance Score for text '{text[:50]}...': {score}")
             return max(0.0, score)
         except Exception as e:
             logger.error(f"Error in relevance scoring: {str(e)}")
             return 0.0
 
-    def extract_text_with_formatting(self, doc: fitz.Document) -> List[Dict]:
-        """Extract text with formatting, handling complex layouts"""
+    def extract_text_with_formatting(self, doc: fitz.Document, page_limit: Optional[int] = None) -> List[Dict]:
+        """Extract text with formatting, handling complex layouts (optionally only the first page_limit pages)"""
         text_elements = []
         
-        for page_num in range(len(doc)):
-            page = doc[page_num]
-            blocks = page.get_text("dict")["blocks"]
+        for page_num, page in enumerate(doc.pages(0, page_limit)):
+            # Image blocks are skipped below, so don't have MuPDF decode them
+            blocks = page.get_text("dict", flags=TEXT_DICT_FLAGS)["blocks"]
             
             current_section = {
                 'heading': '',
@@ -455,34 +559,39 @@ class PDFHeadingExtractor:
             for block in blocks:
                 if "lines" not in block:
                     continue
-                block_text = ""
-                font_info = {}
+                # Cleaned span texts are stripped and non-empty, so joining with single
+                # spaces needs no further stripping
+                line_texts = []
+                # The block takes its formatting from the last span that kept any text
+                last_span = None
                 
                 for line in block["lines"]:
-                    line_text = ""
+                    span_texts = []
                     for span in line["spans"]:
                         text = span["text"].strip()
                         if text:
                             cleaned_text = self.clean_text(text)
                             if cleaned_text:
-                                line_text += cleaned_text + " "
-                                font_info = {
-                                    'font': span["font"],
-                                    'size': span["size"],
-                                    'flags': span["flags"],
-                                    'color': span["color"],
-                                    'bbox': span["bbox"]
-                                }
-                    if line_text.strip():
-                        block_text += line_text.strip() + " "
+                                span_texts.append(cleaned_text)
+                                last_span = span
+                    if span_texts:
+                        line_texts.append(" ".join(span_texts))
                 
-                if block_text.strip():
+                if line_texts:
+                    flags = last_span["flags"]
                     block_texts.append({
-                        'text': block_text.strip(),
-                        'font_info': font_info,
+                        'text': " ".join(line_texts),
+                        'page': page_num,
+                        'font_info': {
+                            'font': last_span["font"],
+                            'size': last_span["size"],
+                            'flags': flags,
+                            'color': last_span["color"],
+                            'bbox': last_span["bbox"]
+                        },
                         'bbox': block.get('bbox', [0, 0, 0, 0]),
-                        'is_bold': bool(font_info.get('flags', 0) & 2**4),
-                        'is_italic': bool(font_info.get('flags', 0) & 2**1)
+                        'is_bold': bool(flags & 2**4),
+                        'is_italic': bool(flags & 2**1)
                     })
             
             # Merge nearby blocks
@@ -509,21 +618,13 @@ class PDFHeadingExtractor:
                 merged_blocks.append(current)
                 i += 1
             
-            for i, block in enumerate(merged_blocks):
-                element = {
-                    'text': block['text'],
-                    'page': page_num,
-                    'font_info': block['font_info'],
-                    'bbox': block['bbox'],
-                    'is_bold': block['is_bold'],
-                    'is_italic': block['is_italic']
-                }
-                
+            # Merged blocks already have every element field, so they are used as the elements
+            for element in merged_blocks:
                 if self.is_potential_heading(element):
+                    # Finished sections are appended as-is: current_section is rebound
+                    # below, and merged block texts are never empty
                     if current_section['heading']:
-                        current_section['subsection_text'] = [p for p in current_section['subsection_text'] if p]
-                        if current_section['subsection_text'] or current_section['heading']:
-                            text_elements.append(current_section.copy())
+                        text_elements.append(current_section)
                     current_section = {
                         'heading': element['text'],
                         'level': None,
@@ -536,69 +637,102 @@ class PDFHeadingExtractor:
                     current_section['subsection_text'].append(element['text'])
                 
             if current_section['heading']:
-                current_section['subsection_text'] = [p for p in current_section['subsection_text'] if p]
-                if current_section['subsection_text'] or current_section['heading']:
-                    text_elements.append(current_section.copy())
+                text_elements.append(current_section)
         
         logger.info(f"Extracted {len(text_elements)} text elements")
         for elem in text_elements[:10]:
             logger.debug(f"Element: {elem['heading']}, Page: {elem['page']}, Font Size: {elem['font_info'].get('size', 10)}")
         return text_elements
 
+    def _empty_result(self, pdf_path: str, font_analysis: Optional[Dict], for_round_1b: bool) -> Dict:
+        """Result returned when no outline could be extracted"""
+        return {
+            "title": "",
+            "outline": [],
+            "text_elements": [] if for_round_1b else None,
+            "font_analysis": font_analysis,
+            "document": os.path.basename(pdf_path) if for_round_1b else None
+        }
+
+    def outline_from_toc(self, toc: List[list]) -> List[Dict]:
+        """Map an embedded bookmark tree (fitz get_toc) onto the outline schema"""
+        outline = []
+        for level, title, page in toc:
+            title = title.strip()
+            # Bookmarks that point outside the document report page -1
+            if title and page >= 1:
+                outline.append({'level': f"H{min(level, 4)}", 'text': title, 'page': page})
+        return outline
+
     def process_pdf(self, pdf_path: str, font_analysis: Optional[Dict] = None, 
-                   for_round_1b: bool = False, persona: str = "", job_to_be_done: str = "") -> Dict:
-        """Process a single PDF for Round 1A or 1B"""
+                   for_round_1b: bool = False, persona: str = "", job_to_be_done: str = "",
+                   max_pages: int = 50, stream: Optional[bytes] = None,
+                   use_embedded_toc: bool = False, raise_errors: bool = False) -> Dict:
+        """Process a single PDF for Round 1A or 1B, raising PDFValidationError for unusable files"""
+        return self.process_pdf_with_page_count(pdf_path, font_analysis, for_round_1b, persona, job_to_be_done,
+                                                max_pages, stream, use_embedded_toc, raise_errors)[0]
+
+    def process_pdf_with_page_count(self, pdf_path: str, font_analysis: Optional[Dict] = None,
+                                    for_round_1b: bool = False, persona: str = "", job_to_be_done: str = "",
+                                    max_pages: int = 50, stream: Optional[bytes] = None,
+                                    use_embedded_toc: bool = False, raise_errors: bool = False) -> Tuple[Dict, int]:
+        """process_pdf that also returns the page count (0 if the PDF could not be opened)"""
+        page_count = 0
         try:
-            doc = fitz.open(pdf_path)
-            if doc.page_count > 50:
-                doc.close()
-                logger.warning(f"PDF {pdf_path} exceeds 50 pages, skipping")
-                return {
-                    "title": "",
-                    "outline": [],
-                    "text_elements": [] if for_round_1b else None,
-                    "font_analysis": font_analysis,
-                    "document": os.path.basename(pdf_path) if for_round_1b else None
-                }
-            
-            logger.info(f"Processing PDF: {pdf_path}, Pages: {doc.page_count}")
-            text_elements = self.extract_text_with_formatting(doc)
+            try:
+                if stream is not None:
+                    doc = fitz.open(stream=stream, filetype='pdf')
+                else:
+                    doc = fitz.open(pdf_path)
+            except Exception as e:
+                raise InvalidPDFError(f"Invalid PDF file: {str(e)}") from e
+            # Validation and extraction share this single open; the document is
+            # not needed once its text has been pulled out, so close it here.
+            with doc:
+                page_count = doc.page_count
+                if page_count == 0:
+                    raise EmptyPDFError("PDF file appears to be empty")
+                if page_count > max_pages:
+                    raise TooManyPagesError(f"PDF has {page_count} pages, exceeding the {max_pages}-page limit")
+                
+                logger.info(f"Processing PDF: {pdf_path}, Pages: {page_count}")
+                
+                # A bookmark outline written by the PDF's author beats the heuristics and
+                # saves scoring every page; only the first page is read, for the title
+                if use_embedded_toc and not for_round_1b:
+                    outline = self.outline_from_toc(doc.get_toc(simple=True))
+                    if outline:
+                        title = (self.extract_title(self.extract_text_with_formatting(doc, page_limit=1), pdf_path)
+                                 or doc.metadata.get('title', '').strip())
+                        logger.info(f"PDF {pdf_path} processed from embedded outline: Title='{title}', Headings={len(outline)}")
+                        return {"title": title, "outline": outline}, page_count
+                
+                text_elements = self.extract_text_with_formatting(doc)
             
             if not text_elements:
-                doc.close()
                 logger.warning(f"No text elements extracted from {pdf_path}")
-                return {
-                    "title": "",
-                    "outline": [],
-                    "text_elements": [] if for_round_1b else None,
-                    "font_analysis": font_analysis,
-                    "document": os.path.basename(pdf_path) if for_round_1b else None
-                }
-            
-            all_elements = []
-            for elem in text_elements:
-                if 'element' in elem:
-                    all_elements.append(elem['element'])
+                return self._empty_result(pdf_path, font_analysis, for_round_1b), page_count
             
+            # Every section carries the element its heading came from
+            all_elements = [elem['element'] for elem in text_elements]
             font_analysis = font_analysis or self.analyze_font_distribution(all_elements)
             logger.debug(f"Font Analysis: {font_analysis}")
             title = self.extract_title(text_elements, pdf_path)
             
             processed_elements = []
             for i, elem in enumerate(text_elements):
-                if 'element' in elem:
-                    prev_elem = text_elements[i - 1]['element'] if i > 0 else None
-                    next_elem = text_elements[i + 1]['element'] if i < len(text_elements) - 1 else None
-                    score = self.calculate_heading_score(elem['element'], font_analysis, prev_elem, next_elem)
-                    level = self.determine_heading_level(score, elem['font_info'].get('size', 10), font_analysis)
-                    if level:
-                        processed_elements.append({
-                            'heading': elem['heading'],
-                            'level': level,
-                            'page': elem['page'],
-                            'subsection_text': elem['subsection_text'],
-                            'score': score
-                        })
+                prev_elem = all_elements[i - 1] if i > 0 else None
+                next_elem = all_elements[i + 1] if i < len(all_elements) - 1 else None
+                score = self.calculate_heading_score(elem['element'], font_analysis, prev_elem, next_elem)
+                level = self.determine_heading_level(score, elem['font_info'].get('size', 10), font_analysis)
+                if level:
+                    processed_elements.append({
+                        'heading': elem['heading'],
+                        'level': level,
+                        'page': elem['page'],
+                        'subsection_text': elem['subsection_text'],
+                        'score': score
+                    })
             
             seen = set()
             unique_elements = []
@@ -616,8 +750,6 @@ class PDFHeadingExtractor:
                 'page': elem['page'] + 1
             } for elem in unique_elements]
             
-            doc.close()
-            
             result = {
                 "title": title,
                 "outline": outline
@@ -631,22 +763,26 @@ class PDFHeadingExtractor:
                 })
             
             logger.info(f"PDF {pdf_path} processed: Title='{title}', Headings={len(outline)}")
-            return result
+            return result, page_count
+        except PDFValidationError:
+            raise
         except Exception as e:
             logger.error(f"Error processing PDF {pdf_path}: {str(e)}")
-            return {
-                "title": "",
-                "outline": [],
-                "text_elements": [] if for_round_1b else None,
-                "font_analysis": font_analysis,
-                "document": os.path.basename(pdf_path) if for_round_1b else None
-            }
+            # Callers that cache results must not mistake a failure for an empty outline
+            if raise_errors:
+                raise PDFExtractionError(f"Extraction failed: {str(e)}") from e
+            return self._empty_result(pdf_path, font_analysis, for_round_1b), page_count
+
+    def process_pdf_bytes(self, data: bytes, name: str = "upload.pdf", max_pages: int = 50,
+                          use_embedded_toc: bool = False) -> Dict:
+        """Process an in-memory PDF without writing it to disk, raising PDFExtractionError if extraction fails"""
+        return self.process_pdf(name, max_pages=max_pages, stream=data, use_embedded_toc=use_embedded_toc,
+                                raise_errors=True)
 
     def process_pdf_collection(self, input_dir: str, documents: List[Dict], 
                               persona: str, job_to_be_done: str) -> List[Dict]:
-        """Process multiple PDFs for Round 1B"""
-        results = []
-        font_analysis = None
+        """Process multiple PDFs for Round 1B, one worker process per document"""
+        pdf_paths = []
         for doc in documents:
             doc_name = doc.get('filename', '') if isinstance(doc, dict) else doc
             if not doc_name:
@@ -656,12 +792,102 @@ class PDFHeadingExtractor:
             if not os.path.exists(pdf_path):
                 logger.warning(f"PDF {doc_name} not found in {input_dir}")
                 continue
-            result = self.process_pdf(pdf_path, font_analysis, True, persona, job_to_be_done)
-            if not font_analysis:
-                font_analysis = result.get('font_analysis')
-            result.pop('font_analysis', None)
-            results.append(result)
-        return results
+            pdf_paths.append(pdf_path)
+        if not pdf_paths:
+            return []
+        
+        # Each document gets its own font analysis, so the files are independent;
+        # map() keeps the results in document order
+        with ProcessPoolExecutor(max_workers=min(os.cpu_count() or 1, len(pdf_paths))) as executor:
+            return list(executor.map(process_pdf_for_analysis, pdf_paths))
+
+    def analyze_documents(self, pdf_results: List[Dict], persona: str, job_to_be_done: str) -> Dict:
+        """Rank the sections and subsections of already-extracted Round 1B results"""
+        extracted_sections = []
+        subsection_analysis = []
+        # The query is the same for every text, so tokenize it once
+        persona_tokens = self.token_set(persona)
+        job_tokens = self.token_set(job_to_be_done)
+        # Headings such as "Introduction" recur across documents; score each distinct text once
+        relevance_scores = {}
+        
+        def relevance(text: str) -> float:
+            text = text[:RELEVANCE_TEXT_LIMIT]
+            if text not in relevance_scores:
+                relevance_scores[text] = self.score_relevance(text, persona, job_to_be_done,
+                                                              persona_tokens, job_tokens)
+            return relevance_scores[text]
+        
+        for pdf_result in pdf_results:
+            doc_name = pdf_result['document']
+            for heading in pdf_result['outline']:
+                section_text = heading['text']
+                relevance_score = relevance(section_text)
+                extracted_sections.append({
+                    'document': doc_name,
+                    'page_number': heading['page'],
+                    'section_title': heading['text'],
+                    'relevance_score': relevance_score
+                })
+            for element in pdf_result['text_elements']:
+                if element['subsection_text']:
+                    # Long sections are only scored and shown in part, so join just that part
+                    subsection_text = self.join_prefix(element['subsection_text'], RELEVANCE_TEXT_LIMIT)
+                    subsection_score = relevance(subsection_text)
+                    refined_text = subsection_text[:1000]
+                    if len(subsection_text) > 1000:
+                        refined_text += "..."
+                    subsection_analysis.append({
+                        'document': doc_name,
+                        'refined_text': refined_text,
+                        'page_number': element['page'] + 1,
+                        'relevance_score': subsection_score
+                    })
+        
+        # itemgetter keeps the key calls (one per item) in C; sort() is stable, so ties keep document order
+        by_relevance = itemgetter('relevance_score')
+        extracted_sections.sort(key=by_relevance, reverse=True)
+        for rank, section in enumerate(extracted_sections, 1):
+            section['importance_rank'] = rank
+            del section['relevance_score']
+        
+        subsection_analysis.sort(key=by_relevance, reverse=True)
+        
+        return {
+            'extracted_sections': extracted_sections,
+            'subsection_analysis': subsection_analysis
+        }
+
+# Extractor reused by every task a pool worker process runs
+_worker_extractor = None
+
+def get_worker_extractor() -> PDFHeadingExtractor:
+    """Return this process's extractor, creating it on first use"""
+    global _worker_extractor
+    if _worker_extractor is None:
+        _worker_extractor = PDFHeadingExtractor()
+    return _worker_extractor
+
+# The functions below are top-level so they can be submitted to a process pool
+
+def process_pdf_for_outline(pdf_path: str) -> Dict:
+    """Round 1A extraction of a single PDF"""
+    return get_worker_extractor().process_pdf(pdf_path)
+
+def process_pdf_bytes_for_outline(data: bytes, name: str, max_pages: int = 50) -> Dict:
+    """Round 1A extraction of an uploaded PDF, using its embedded bookmarks when present"""
+    return get_worker_extractor().process_pdf_bytes(data, name, max_pages=max_pages, use_embedded_toc=True)
+
+def process_pdf_for_analysis(pdf_path: str, max_pages: int = 50) -> Dict:
+    """Round 1B extraction of a single PDF, falling back to an empty result for unusable files"""
+    extractor = get_worker_extractor()
+    try:
+        result = extractor.process_pdf(pdf_path, for_round_1b=True, max_pages=max_pages)
+    except PDFValidationError as e:
+        logger.warning(f"Skipping {pdf_path}: {str(e)}")
+        result = extractor._empty_result(pdf_path, None, True)
+    result.pop('font_analysis', None)
+    return result
 
 def main():
     """Main function for Round 1A and 1B execution"""
@@ -691,48 +917,16 @@ def main():
         logger.info(f"Processing {len(documents)} documents for persona: {persona}, job: {job_to_be_done}")
         
         pdf_results = extractor.process_pdf_collection(input_dir, documents, persona, job_to_be_done)
-        
-        extracted_sections = []
-        subsection_analysis = []
-        
-        for pdf_result in pdf_results:
-            doc_name = pdf_result['document']
-            for heading in pdf_result['outline']:
-                section_text = heading['text']
-                relevance_score = extractor.score_relevance(section_text, persona, job_to_be_done)
-                extracted_sections.append({
-                    'document': doc_name,
-                    'page_number': heading['page'],
-                    'section_title': heading['text'],
-                    'relevance_score': relevance_score
-                })
-            for element in pdf_result['text_elements']:
-                if element['subsection_text']:
-                    subsection_text = ' '.join(element['subsection_text'])
-                    subsection_score = extractor.score_relevance(subsection_text, persona, job_to_be_done)
-                    refined_text = subsection_text[:1000]
-                    if len(subsection_text) > 1000:
-                        refined_text += "..."
-                    subsection_analysis.append({
-                        'document': doc_name,
-                        'refined_text': refined_text,
-                        'page_number': element['page'] + 1,
-                        'relevance_score': subsection_score
-                    })
-        
-        extracted_sections.sort(key=lambda x: x['relevance_score'], reverse=True)
-        for i, section in enumerate(extracted_sections):
-            section['importance_rank'] = i + 1
-            del section['relevance_score']
-        
-        subsection_analysis.sort(key=lambda x: x['relevance_score'], reverse=True)
+        analysis = extractor.analyze_documents(pdf_results, persona, job_to_be_done)
+        extracted_sections = analysis['extracted_sections']
+        subsection_analysis = analysis['subsection_analysis']
         
         output = {
             'metadata': {
                 'input_documents': [doc.get('filename', doc) for doc in documents],
                 'persona': persona,
                 'job_to_be_done': job_to_be_done,
-                'timestamp': datetime.utcnow().isoformat() + 'Z'
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
             },
             'extracted_sections': extracted_sections,
             'subsection_analysis': subsection_analysis
@@ -740,27 +934,34 @@ def main():
         
         output_path = os.path.join(output_dir, 'output.json')
         try:
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(output, f, ensure_ascii=False, indent=2)
+            with open(output_path, 'wb') as f:
+                f.write(orjson.dumps(output, option=orjson.OPT_INDENT_2))
             logger.info(f"Output saved: {output_path}")
             logger.info(f"Summary: {len(pdf_results)} documents, {len(extracted_sections)} sections, {len(subsection_analysis)} subsections")
         except Exception as e:
             logger.error(f"Error writing output: {str(e)}")
     else:
-        # Round 1A: Process individual PDFs
-        for filename in os.listdir(input_dir):
-            if filename.lower().endswith('.pdf'):
-                pdf_path = os.path.join(input_dir, filename)
+        # Round 1A: Process individual PDFs, one worker process per file
+        filenames = [filename for filename in os.listdir(input_dir) if filename.lower().endswith('.pdf')]
+        if not filenames:
+            return
+        with ProcessPoolExecutor(max_workers=min(os.cpu_count() or 1, len(filenames))) as executor:
+            futures = {filename: executor.submit(process_pdf_for_outline, os.path.join(input_dir, filename))
+                       for filename in filenames}
+            for filename, future in futures.items():
                 output_filename = os.path.splitext(filename)[0] + '.json'
                 output_path = os.path.join(output_dir, output_filename)
                 
-                logger.info(f"Processing: {filename}")
-                result = extractor.process_pdf(pdf_path)
+                try:
+                    result = future.result()
+                except PDFValidationError as e:
+                    logger.warning(f"Skipping {filename}: {str(e)}")
+                    result = {"title": "", "outline": []}
                 
                 try:
-                    with open(output_path, 'w', encoding='utf-8') as f:
-                        json.dump({"title": result["title"], "outline": result["outline"]}, 
-                                 f, ensure_ascii=False, indent=2)
+                    with open(output_path, 'wb') as f:
+                        f.write(orjson.dumps({"title": result["title"], "outline": result["outline"]},
+                                             option=orjson.OPT_INDENT_2))
                     logger.info(f"Output saved: {output_filename}")
                 except Exception as e:
                     logger.error(f"Error writing output for {output_filename}: {str(e)}")
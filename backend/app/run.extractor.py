@@ -1,6 +1,7 @@
 import os
-import json
+import orjson
 import logging
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from PDFOutlineExtractor import PDFOutlineExtractor  # Ensure this file exists
 
@@ -8,6 +9,16 @@ from PDFOutlineExtractor import PDFOutlineExtractor  # Ensure this file exists
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Extractor reused by every file a worker process handles
+_extractor = None
+
+def process_file(pdf_path: str) -> dict:
+    """Extract one PDF's outline in a worker process"""
+    global _extractor
+    if _extractor is None:
+        _extractor = PDFOutlineExtractor()
+    return _extractor.process_pdf(pdf_path)
+
 def main():
     input_dir = Path("/app/input")
     output_dir = Path("/app/output")
@@ -15,27 +26,27 @@ def main():
     # Ensure output directory exists
     output_dir.mkdir(exist_ok=True)
 
-    extractor = PDFOutlineExtractor()
-
     # Process all PDF files
     pdf_files = list(input_dir.glob("*.pdf"))
     if not pdf_files:
         logger.warning("No PDF files found in /app/input")
         return
 
-    for pdf_file in pdf_files:
-        try:
-            logger.info(f"Processing {pdf_file.name}")
-            result = extractor.process_pdf(str(pdf_file))
-
-            # Output file
-            output_file = output_dir / f"{pdf_file.stem}.json"
-            with open(output_file, "w", encoding="utf-8") as f:
-                json.dump(result, f, indent=2, ensure_ascii=False)
-
-            logger.info(f"Saved to {output_file.name}")
-        except Exception as e:
-            logger.error(f"Failed to process {pdf_file.name}: {str(e)}")
+    # PDFs are independent, so each goes to a worker process; outputs are written here
+    with ProcessPoolExecutor(max_workers=min(os.cpu_count() or 1, len(pdf_files))) as executor:
+        futures = {pdf_file: executor.submit(process_file, str(pdf_file)) for pdf_file in pdf_files}
+        for pdf_file, future in futures.items():
+            try:
+                logger.info(f"Processing {pdf_file.name}")
+                result = future.result()
+
+                # Output file
+                output_file = output_dir / f"{pdf_file.stem}.json"
+                output_file.write_bytes(orjson.dumps(result, option=orjson.OPT_INDENT_2))
+
+                logger.info(f"Saved to {output_file.name}")
+            except Exception as e:
+                logger.error(f"Failed to process {pdf_file.name}: {str(e)}")
 
 if __name__ == "__main__":
     main()